@@ -5,6 +5,7 @@ from logging.handlers import RotatingFileHandler
 from logging import getLogger, StreamHandler, Formatter, INFO, DEBUG
 import os
 import json
+from importlib import import_module
 
 
 def get_logger(name=None, stream_log_level=INFO, file_log_level=DEBUG, encoding='utf-8', log_dir=''):
@@ -34,6 +35,16 @@ def get_logger(name=None, stream_log_level=INFO, file_log_level=DEBUG, encoding=
     return logger
 
 
+def lazy_import(name):
+    """
+    Import module on first use, so that importing the caller stays fast.
+    :param name: full module name
+    :return: module
+    """
+
+    return import_module(name)
+
+
 def load_config(file_name, encoding='utf-8'):
     with open(file_name, 'r', encoding=encoding) as fp:
         config = json.load(fp)
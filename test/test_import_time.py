@@ -0,0 +1,39 @@
+# coding=utf-8
+
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_BUDGET = 0.2  # seconds, generous for slow CI hosts
+LAZY_MODULES = ["json5", "jsonpath_rw", "lxml", "requests", "js2py"]
+
+CODE = r"""
+import sys, time, json
+started = time.perf_counter()
+import tiny_engine, tools.TinyRequestsEngine
+elapsed = time.perf_counter() - started
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+class TestImportTime(unittest.TestCase):
+    def test_import_is_lazy_and_fast(self):
+        # fresh interpreter, as a short-lived CLI invocation or a spawned pool worker
+        subprocess.run([sys.executable, "-c", "import tiny_engine, tools.TinyRequestsEngine"], cwd=ROOT_DIR,
+                       check=True)  # warm up bytecode cache
+        output = subprocess.run([sys.executable, "-c", CODE], cwd=ROOT_DIR, check=True,
+                                stdout=subprocess.PIPE).stdout
+        result = json.loads(output.decode("utf-8"))
+
+        modules = set(result["modules"])
+        for name in LAZY_MODULES:
+            self.assertNotIn(name, modules)
+        self.assertLess(result["elapsed"], IMPORT_TIME_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,409 @@
+# coding=utf-8
+
+import os
+import sys
+import json
+import pickle
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tiny_engine import TinyEngine
+
+
+def get_test_logger():
+    logger = logging.getLogger("test_tiny_engine")
+    if len(logger.handlers) <= 0:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+    return logger
+
+
+class EngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def spill_files(self):
+        return [i for i in os.listdir(self.tmp_dir.name) if i.startswith("tiny_vars_")]
+
+    def engine(self, script, **kwargs):
+        return TinyEngine(script=script, logger=get_test_logger(), **kwargs)
+
+
+class TestVars(EngineTestCase):
+    def vars(self, budget=10000):
+        return TinyEngine.Vars(memory_budget=budget, spill_dir=self.tmp_dir.name)
+
+    def test_spill_and_lazy_reload(self):
+        v = self.vars()
+        v["a"] = "a" * 6000
+        v["b"] = b"b" * 6000
+        self.assertEqual(v.spilled, ["a"])
+        self.assertEqual(len(self.spill_files()), 1)
+        self.assertIn("a", v)
+        self.assertEqual(len(v), 2)
+
+        self.assertEqual(v["a"], "a" * 6000)
+        self.assertEqual(v.spilled, ["b"])
+        self.assertEqual(v["b"], b"b" * 6000)
+        self.assertEqual(len(self.spill_files()), 1)
+
+    def test_del_removes_spill_file(self):
+        v = self.vars()
+        v["a"] = "a" * 6000
+        v["b"] = "b" * 6000
+        del v["a"]
+        self.assertEqual(self.spill_files(), [])
+        self.assertEqual(sorted(v), ["b"])
+
+    def test_close_and_finalize_remove_spill_files(self):
+        v = self.vars(budget=0)
+        v["a"] = "a" * 6000
+        v["b"] = "b" * 6000
+        v["c"] = "c" * 6000
+        v.close(keep=["b"])
+        self.assertEqual(self.spill_files(), [])
+        self.assertEqual(dict(v), {"b": "b" * 6000, "c": "c" * 6000})
+
+        v = self.vars(budget=0)
+        v["a"] = "a" * 6000
+        v["b"] = "b" * 6000
+        self.assertEqual(len(self.spill_files()), 1)
+        del v
+        self.assertEqual(self.spill_files(), [])
+
+    def test_pickle_inlines_spilled_values(self):
+        v = self.vars()
+        v["a"] = "a" * 6000
+        v["b"] = "b" * 6000
+        copied = pickle.loads(pickle.dumps(v))
+        self.assertEqual(copied["a"], "a" * 6000)
+        self.assertEqual(v["a"], "a" * 6000)
+        self.assertEqual(dict(copied), dict(v))
+
+    def test_run_closes_spilled_vars(self):
+        script = "[['read', ['a', 'a.txt']], ['read', ['b', 'a.txt']]]"
+        file_name = os.path.join(self.tmp_dir.name, "a.txt")
+        with open(file_name, "w") as fp:
+            fp.write("x" * 6000)
+        e = self.engine(script.replace("a.txt", file_name.replace("\\", "/")), release_vars=True, keep_vars=["a"])
+        e.run(args=TinyEngine.Args(memory_budget=0, spill_dir=self.tmp_dir.name))
+        self.assertEqual(self.spill_files(), [])
+
+    def test_run_without_release_keeps_spilled_vars(self):
+        file_name = os.path.join(self.tmp_dir.name, "page.txt")
+        with open(file_name, "w") as fp:
+            fp.write("x" * 6000)
+        file_name = file_name.replace("\\", "/")
+        scripts = [
+            "[['read', ['page1', '{0}']], ['read', ['page2', '{0}']], ['msg', 'done']]",
+            "[['read', ['page1', '{0}']], ['read', ['page2', '{0}']], ['finish']]",
+        ]
+        for script in scripts:
+            e = self.engine(script.format(file_name))
+            args = TinyEngine.Args(memory_budget=1000, spill_dir=self.tmp_dir.name)
+            try:
+                e.run(args=args)
+            except TinyEngine.FinishException:
+                pass
+            self.assertEqual(sorted(args.vars), ["page1", "page2"])
+            self.assertEqual(args.vars["page1"], "x" * 6000)
+            self.assertEqual(args.vars["page2"], "x" * 6000)
+            args.vars.close()
+            self.assertEqual(self.spill_files(), [])
+
+
+class TestRelease(EngineTestCase):
+    SCRIPT = """[
+        ['vars_', { page: 'x', big: 'y', unused: 'z' }],
+        ['vars_', { url: 'http://$%page%$/' }],
+        [ ['print', 'big'], ['assert', 'big', [['print', 'page']]] ],
+        ['msg', 'end'],
+    ]"""
+
+    def test_release_dead_vars(self):
+        e = self.engine(self.SCRIPT, release_vars=True)
+        e.run()
+        self.assertEqual(dict(e._args.vars), {})
+
+    def test_keep_vars(self):
+        e = self.engine(self.SCRIPT, release_vars=True, keep_vars=["url", "page"])
+        e.run()
+        self.assertEqual(dict(e._args.vars), {"url": "http://$%page%$/", "page": "x"})
+
+    def test_release_in_rerun_loop(self):
+        script = """[
+            ['vars_', { n: 1, s: 'hello' }],
+            [
+                ['assert', ['n', 'in', [2]], ['break']],
+                ['vars_', { n: 2 }],
+                ['print', 's'],
+                ['rerun'],
+            ],
+            ['print', 'n'],
+        ]"""
+        e = self.engine(script, release_vars=True, keep_vars=["s"])
+        e.run()
+        self.assertEqual(dict(e._args.vars), {"s": "hello"})
+
+    def test_del(self):
+        e = self.engine("[['vars_', { a: 1, b: 2, c: 3 }], ['del', ['a', 'b', 'x']]]")
+        e.run()
+        self.assertEqual(dict(e._args.vars), {"c": 3})
+
+
+class TestSuspend(EngineTestCase):
+    def run_with_inputs(self, script, inputs, **kwargs):
+        e = self.engine(script, **kwargs)
+        result = e.run()
+        paths = []
+        inputs = list(inputs)
+        while isinstance(result, TinyEngine.Continuation):
+            paths.append(result.path)
+            # continuations are parked by the host, and resumed by a fresh engine
+            result = pickle.loads(pickle.dumps(result))
+            result = self.engine(script, **kwargs).resume(result, inputs.pop(0))
+        self.assertEqual(inputs, [])
+        return result, paths
+
+    def test_suspend_through_assert_and_call(self):
+        script = """[
+            ['vars_', { sub: [['wait', 'x'], ['assign_', { got_x: 'x' }]], sub2: [['wait', 'y']] }],
+            ['assert', 'sub', [['msg', 'in assert'], ['wait', 'sms'], ['assign_', { got_sms: 'sms' }]]],
+            ['assert', 'sub', ['wait', 'direct']],
+            ['call', ['sub', 'sub2']],
+            [['wait', 'last']],
+        ]"""
+        e = self.engine(script)
+        c = e.run()
+        self.assertEqual(c.path, [1, (TinyEngine.FRAME_SUB, 2), 2])
+        self.assertEqual(c.var, "sms")
+
+        result, paths = self.run_with_inputs(script, ["S", "D", "X", "Y", "L"])
+        self.assertIsNone(result)
+        self.assertEqual(paths, [
+            [1, (TinyEngine.FRAME_SUB, 2), 2],
+            [3],
+            [3, (TinyEngine.FRAME_CALL, 0), 1],
+            [3, (TinyEngine.FRAME_CALL, 1), 1],
+            [4, 1],
+        ])
+
+    def test_resume_vars(self):
+        script = "[['vars_', { a: 1 }], ['wait', 'x'], ['assign_', { b: 'x' }]]"
+        e = self.engine(script)
+        c = e.run()
+        e = self.engine(script)
+        self.assertIsNone(e.resume(c, "input"))
+        self.assertEqual(dict(c.args.vars), {"a": 1, "x": "input", "b": "input"})
+
+    def test_resume_json_path(self):
+        script = "[['vars_', { a: 1 }], ['assert', 'a', [['wait', 'x'], ['assign_', { b: 'x' }]]]]"
+        c = self.engine(script).run()
+        path = json.loads(json.dumps(c.path))
+        c = TinyEngine.Continuation(path, c.args, c.var)
+        self.assertIsNone(self.engine(script).resume(c, 2))
+        self.assertEqual(c.args.vars["b"], 2)
+
+    def test_resume_rerun_loop(self):
+        script = """[
+            ['vars_', { n: 0 }],
+            [
+                ['wait', 'x'],
+                ['assert', ['x', 'in', ['done']], ['break']],
+                ['vars_', { looped: 1 }],
+                ['rerun'],
+            ],
+            ['vars_', { end: 1 }],
+        ]"""
+        result, paths = self.run_with_inputs(script, ["a", "b", "done"])
+        self.assertIsNone(result)
+        self.assertEqual(paths, [[1, 1], [1, 1], [1, 1]])
+
+    def test_wait_var_not_valid(self):
+        for script in ["[['wait', ['sms']]]", "[['wait']]"]:
+            with self.assertRaises(RuntimeError):
+                self.engine(script).run()
+
+    def test_release_with_resume(self):
+        script = "[['vars_', { a: 1, b: 2 }], ['wait', 'x'], ['assign_', { c: 'x' }], ['print', 'b']]"
+        e = self.engine(script, release_vars=True, keep_vars=["c"])
+        c = e.run()
+        self.assertIsNone(e.resume(c, 3))
+        self.assertEqual(dict(c.args.vars), {"c": 3})
+
+
+class CrashException(Exception):
+    pass
+
+
+class CrashingEngine(TinyEngine):
+    crash = True
+
+    def __init__(self, **kwargs):
+        super(CrashingEngine, self).__init__(**kwargs)
+        self.register_runner("crash", self.run_crash)
+
+    def run_crash(self, sobj, args, depth=0):
+        if self.crash:
+            raise CrashException()
+
+
+class TestCheckpoint(EngineTestCase):
+    SCRIPT = """[
+        ['vars_', { n: 0, big: 'xxxxx' }],
+        ['vars_', { a: 1 }],
+        ['checkpoint'],
+        ['vars_', { b: 2 }],
+        ['del', 'big'],
+        ['assert', 'a', [['vars_', { c: 3 }], ['checkpoint'], ['crash'], ['vars_', { d: 4 }]]],
+        ['vars_', { e: 5 }],
+    ]"""
+
+    def setUp(self):
+        super(TestCheckpoint, self).setUp()
+        self.checkpoint_file = os.path.join(self.tmp_dir.name, "checkpoint.bin")
+
+    def engine(self, script, crash=True, **kwargs):
+        e = CrashingEngine(script=script, logger=get_test_logger(), checkpoint_file=self.checkpoint_file, **kwargs)
+        e.crash = crash
+        return e
+
+    def crash(self, script=SCRIPT, **kwargs):
+        with self.assertRaises(CrashException):
+            self.engine(script, **kwargs).run()
+
+    def records(self):
+        records = []
+        with open(self.checkpoint_file, "rb") as fp:
+            while True:
+                try:
+                    records.append(pickle.load(fp))
+                except EOFError:
+                    return records
+
+    def test_full_and_delta_records(self):
+        self.crash()
+        records = self.records()
+        self.assertEqual([r["full"] for r in records], [True, False])
+        self.assertEqual(sorted(records[0]["set"]), ["a", "big", "n"])
+        self.assertEqual(records[0]["path"], [3])
+        self.assertEqual(sorted(records[1]["set"]), ["b", "c"])
+        self.assertEqual(records[1]["del"], ["big"])
+        self.assertEqual(records[1]["path"], [5, (TinyEngine.FRAME_SUB, 2), 2])
+
+    def test_resume_from_checkpoint(self):
+        self.crash()
+        e = self.engine(self.SCRIPT, crash=False)
+        e.run()
+        self.assertEqual(dict(e._args.vars), {"n": 0, "a": 1, "b": 2, "c": 3, "d": 4, "e": 5})
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_every_n_nodes(self):
+        self.crash(checkpoint_every=2)
+        records = self.records()
+        self.assertTrue(records[0]["full"])
+        self.assertEqual(records[-1]["path"], [5, (TinyEngine.FRAME_SUB, 2), 2])
+        e = self.engine(self.SCRIPT, crash=False)
+        e.run()
+        self.assertEqual(e._args.vars["e"], 5)
+
+    def test_truncated_record(self):
+        self.crash()
+        with open(self.checkpoint_file, "rb") as fp:
+            data = fp.read()
+        with open(self.checkpoint_file, "ab") as fp:
+            fp.write(data[:len(data) // 3])
+
+        e = self.engine(self.SCRIPT, crash=False)
+        e.run()
+        self.assertEqual(e._args.vars["d"], 4)
+        self.assertNotIn("big", e._args.vars)
+
+    def test_truncated_delta_falls_back(self):
+        self.crash()
+        records = self.records()
+        with open(self.checkpoint_file, "wb") as fp:
+            pickle.dump(records[0], fp)
+            fp.write(pickle.dumps(records[1])[:10])
+
+        e = self.engine(self.SCRIPT, crash=False)
+        e.run()
+        # resumed after the first checkpoint node, so 'big' is deleted again
+        self.assertEqual(dict(e._args.vars), {"n": 0, "a": 1, "b": 2, "c": 3, "d": 4, "e": 5})
+
+    def test_edited_script_ignores_checkpoint(self):
+        self.crash()
+        edited = self.SCRIPT.replace("n: 0", "n: 7")
+        e = self.engine(edited, crash=False)
+        e.run()
+        self.assertEqual(e._args.vars["n"], 7)  # ran from the first node
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_compaction_bounds_file_size(self):
+        script = """[
+            ['vars_', { n: 0 }],
+            [
+                ['bump'],
+                ['assert', ['n', 'in', [50]], ['break']],
+                ['rerun'],
+            ],
+            ['crash'],
+        ]"""
+        size = 100000
+
+        def run_bump(sobj, args, depth=0):
+            n = args.vars["n"] + 1
+            args.vars["n"] = n
+            args.vars["page"] = str(n % 10) * size
+
+        e = self.engine(script, checkpoint_every=1)
+        e.register_runner("bump", run_bump)
+        with self.assertRaises(CrashException):
+            e.run()
+        self.assertLess(os.path.getsize(self.checkpoint_file), 3 * size)
+
+        e = self.engine(script, crash=False)
+        e.register_runner("bump", run_bump)
+        e.run()
+        self.assertEqual(e._args.vars["n"], 50)
+        self.assertEqual(e._args.vars["page"], "0" * size)
+
+    def test_untrusted_checkpoint_ignored(self):
+        self.crash()
+        e = self.engine(self.SCRIPT, crash=False)
+        e._checkpoint_script = e.script_hash(e.script_obj)
+        os.chmod(self.checkpoint_file, 0o666)
+        self.assertFalse(e.restore_checkpoint(TinyEngine.Args()))
+        os.chmod(self.checkpoint_file, 0o600)
+        self.assertTrue(e.restore_checkpoint(TinyEngine.Args()))
+
+    def test_invalid_resume_step(self):
+        script = "[['vars_', { a: 1 }], ['assert', 'a', [['vars_', { b: 2 }]]]]"
+        e = self.engine(script, crash=False)
+        e._args.vars["a"] = 1
+        e._resume_path = [1, 1]
+        e.execute_script(e.script_obj, e._args)
+        self.assertEqual(dict(e._args.vars), {"a": 1, "b": 2})
+
+    def test_spilled_values_stay_spilled(self):
+        script = "[['vars_', { a: 1 }], ['checkpoint'], ['crash']]"
+        args = TinyEngine.Args(memory_budget=0, spill_dir=self.tmp_dir.name)
+        args.vars["x"] = "x" * 6000
+        args.vars["y"] = "y" * 6000
+        spilled = self.spill_files()
+        with self.assertRaises(CrashException):
+            self.engine(script).run(args=args)
+        self.assertEqual(self.spill_files(), spilled)
+        self.assertEqual(args.vars.spilled, ["x"])
+
+        e = self.engine(script, crash=False)
+        e.run()
+        self.assertEqual(e._args.vars["x"], "x" * 6000)
+
+
+if __name__ == "__main__":
+    unittest.main()
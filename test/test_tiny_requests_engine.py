@@ -0,0 +1,97 @@
+# coding=utf-8
+
+import os
+import sys
+import json
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.TinyRequestsEngine import TinyRequestsEngine
+
+try:
+    import js2py
+except ImportError:
+    js2py = None
+
+JS = "var calls = 0; function add(a, b) { calls += 1; return a + b + calls; }"
+
+
+def get_test_logger():
+    logger = logging.getLogger("test_tiny_requests_engine")
+    if len(logger.handlers) <= 0:
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+    return logger
+
+
+@unittest.skipIf(js2py is None, "js2py is not installed")
+class TestEvalJs(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache_dir = os.path.join(self.tmp_dir.name, "js")
+        TinyRequestsEngine._js_codes.clear()
+        self.addCleanup(TinyRequestsEngine._js_codes.clear)
+
+        translate_js = js2py.translate_js
+        patcher = mock.patch.object(js2py, "translate_js", side_effect=translate_js)
+        self.translate_js = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cache_files(self):
+        return os.listdir(self.cache_dir) if os.path.isdir(self.cache_dir) else []
+
+    def eval_js(self, func="add", calls=1):
+        script = [["eval_js", {"var": "r{}".format(i), "js": "js", "func": func, "args": ["a", "b"]}]
+                  for i in range(calls)]
+        engine = TinyRequestsEngine(script=json.dumps(script), logger=get_test_logger(),
+                                    js_cache_dir=self.cache_dir)
+        args = engine.Args()
+        args.vars.update({"js": JS, "a": 1, "b": 2})
+        engine.run(engine.script_obj, args)
+        return [args.vars["r{}".format(i)] for i in range(calls)]
+
+    def test_memory_hit(self):
+        self.assertEqual(self.eval_js(calls=2), [4, 5])
+        self.assertEqual(self.translate_js.call_count, 1)
+        self.assertEqual(len(self.cache_files()), 1)
+
+        # translated code is shared, but every engine runs it in a fresh scope
+        self.assertEqual(self.eval_js(), [4])
+        self.assertEqual(self.translate_js.call_count, 1)
+
+    def test_disk_hit(self):
+        self.eval_js()
+        TinyRequestsEngine._js_codes.clear()
+        self.assertEqual(self.eval_js(), [4])
+        self.assertEqual(self.translate_js.call_count, 1)
+
+    def test_cache_key_has_js2py_version(self):
+        key = TinyRequestsEngine.js_cache_key(JS)
+        with mock.patch.object(TinyRequestsEngine, "_js2py_version", "0.0.0"):
+            self.assertNotEqual(TinyRequestsEngine.js_cache_key(JS), key)
+
+    def test_untrusted_dir_not_used(self):
+        os.makedirs(self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+        self.assertEqual(self.eval_js(), [4])
+        self.assertEqual(self.cache_files(), [])
+
+        TinyRequestsEngine._js_codes.clear()
+        self.eval_js()
+        self.assertEqual(self.translate_js.call_count, 2)
+        self.assertEqual(self.cache_files(), [])
+
+    def test_missing_func(self):
+        with self.assertRaisesRegex(RuntimeError, "'nope'"):
+            self.eval_js(func="nope")
+        with self.assertRaisesRegex(RuntimeError, "'calls'"):
+            self.eval_js(func="calls")
+
+
+if __name__ == "__main__":
+    unittest.main()
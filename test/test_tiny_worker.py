@@ -0,0 +1,106 @@
+# coding=utf-8
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiny_worker
+from tiny_worker import WorkerStats, init_worker, load_script, run_job
+
+
+class TestRunJob(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        init_worker(tiny_worker.ENGINE_TINY, log_level=logging.CRITICAL)
+        tiny_worker._script_cache.clear()
+        self.addCleanup(tiny_worker._script_cache.clear)
+
+    def script_file(self, script, name="job.json5"):
+        fp = os.path.join(self.tmp_dir.name, name)
+        with open(fp, "w", encoding="utf-8") as f:
+            f.write(script)
+        return fp
+
+    def run_job(self, job):
+        line = job if isinstance(job, str) else json.dumps(job)
+        submitted, result = run_job((line, 1.0))
+        self.assertEqual(submitted, 1.0)
+        self.assertGreaterEqual(result["service"], 0.0)
+        # results are streamed out as JSONL, and parked ones come back as job records
+        return json.loads(json.dumps(result))
+
+    def test_plain_job(self):
+        fp = self.script_file("[['assign_', { b: 'a' }]]")
+        result = self.run_job({"id": 1, "script": fp, "vars": {"a": 2}})
+        self.assertTrue(result["ok"])
+        self.assertEqual(result["id"], 1)
+        self.assertEqual(result["vars"], {"a": 2, "b": 2})
+        self.assertNotIn("wait", result)
+
+    def test_suspend_and_resume(self):
+        fp = self.script_file("[['vars_', { a: 1 }], ['wait', 'sms'], ['assign_', { got: 'sms' }]]")
+        result = self.run_job({"id": "s", "script": fp})
+        self.assertTrue(result["ok"])
+        self.assertEqual(result["wait"], "sms")
+        self.assertEqual(result["path"], [2])
+        self.assertEqual(result["vars"], {"a": 1})
+
+        result = self.run_job({"id": "s", "script": fp, "vars": result["vars"], "path": result["path"],
+                               "wait": result["wait"], "value": "1234"})
+        self.assertTrue(result["ok"])
+        self.assertNotIn("wait", result)
+        self.assertEqual(result["vars"], {"a": 1, "sms": "1234", "got": "1234"})
+
+    def test_bad_json(self):
+        result = self.run_job("{not json")
+        self.assertFalse(result["ok"])
+        self.assertIsNone(result["id"])
+        self.assertIn("error", result)
+
+    def test_missing_script(self):
+        result = self.run_job({"id": 2, "script": os.path.join(self.tmp_dir.name, "missing.json5")})
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["id"], 2)
+        self.assertIn("FileNotFoundError", result["error"])
+
+    def test_load_script_mtime_cache(self):
+        fp = self.script_file("[['vars_', { a: 1 }]]")
+        sobj = load_script(fp)
+        self.assertIs(load_script(fp), sobj)
+
+        with open(fp, "w", encoding="utf-8") as f:
+            f.write("[['vars_', { a: 2 }]]")
+        mtime = os.stat(fp).st_mtime + 1
+        os.utime(fp, (mtime, mtime))
+        self.assertEqual(load_script(fp), [["vars_", {"a": 2}]])
+
+
+class TestWorkerStats(unittest.TestCase):
+    def test_summary(self):
+        stats = WorkerStats()
+        self.assertEqual(stats.summary()["jobs"], 0)
+        self.assertEqual(stats.summary()["latency_p95"], 0.0)
+
+        for i in range(1, 11):
+            stats.add({"ok": i != 3, "latency": i / 10.0, "service": 0.05})
+        time.sleep(0.01)
+        summary = stats.summary()
+        self.assertEqual(summary["jobs"], 10)
+        self.assertEqual(summary["failed"], 1)
+        self.assertAlmostEqual(summary["latency_mean"], 0.55)
+        self.assertEqual(summary["latency_p50"], 0.6)
+        self.assertEqual(summary["latency_p95"], 1.0)
+        self.assertEqual(summary["latency_max"], 1.0)
+        self.assertAlmostEqual(summary["service_mean"], 0.05)
+        self.assertGreater(summary["throughput"], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,17 +2,16 @@
 
 import traceback as tb
 import sys
+import os
 import types
 import re
 import json
-import json5
-from copy import deepcopy
+import pickle
+import hashlib
+import weakref
+from collections.abc import MutableMapping
 
-import jsonpath_rw as jp
-from lxml.etree import fromstring as et_fromstring
-from lxml.html import fromstring as html_fromstring
-
-from MiniUtils import get_logger
+from MiniUtils import get_logger, lazy_import
 
 __version__ = "1.0.190731"
 
@@ -36,6 +35,9 @@ class TinyEngine:
     CMD_READ = "read"
     CMD_WRITE = "write"
     CMD_APPEND = "append"
+    CMD_DEL = "del"
+    CMD_WAIT = "wait"
+    CMD_CHECKPOINT = "checkpoint"
 
     ARG_VAR = "var"
 
@@ -43,6 +45,15 @@ class TinyEngine:
     AFUNC_IN = "in"
     AFUNC_PREFER = [AFUNC_RE, AFUNC_IN]
 
+    # heavy modules imported on first use of the matching command
+    LAZY_MODULES = ["json5", "jsonpath_rw", "lxml.etree"]
+
+    # frames of command nodes in the program position
+    FRAME_SUB = "sub"
+    FRAME_CALL = "call"
+
+    VAR_PLACEHOLDER_RE = re.compile(r"\$\%(.+?)\%\$")
+
     class RerunException(Exception):
         """
         For flow controlling - Rerun
@@ -67,14 +78,211 @@ class TinyEngine:
         def __init__(self, *args, **kwargs):
             Exception.__init__(self, *args, **kwargs)
 
+    class SuspendException(Exception):
+        """
+        For flow controlling - Suspend, waiting for external input
+        """
+
+        def __init__(self, path, var, *args, **kwargs):
+            Exception.__init__(self, *args, **kwargs)
+            self.path = path
+            self.var = var
+
+    class Continuation:
+        """
+        For resuming a suspended script, with the program position after the wait node and the running environment
+        """
+
+        def __init__(self, path, args, var=None):
+            self.path = path  # None if nothing is left to run
+            self.args = args
+            self.var = var  # variable waiting for the external input
+
+        def __repr__(self):
+            return "{}(path={}, var={})".format(self.__class__.__name__, repr(self.path), repr(self.var))
+
+    class Vars(MutableMapping):
+        """
+        For saving variables, large string/bytes values are spilled to temporary files when over the memory budget
+        """
+
+        SPILL_MIN_SIZE = 4096
+
+        def __init__(self, memory_budget=None, spill_dir=None):
+            self._data = dict()
+            self._spilled = dict()  # name -> (file path, is str)
+            self._sizes = dict()  # name -> size of spillable value in memory
+            self._size = 0
+            self._memory_budget = memory_budget
+            self._spill_dir = spill_dir
+            self._changed = set()  # names set since last pop_changes()
+            self._deleted = set()  # names deleted since last pop_changes()
+            # fallback for removing spill files left when dropped without close()
+            self._finalizer = weakref.finalize(self, self._remove_files, self._spilled)
+
+        def __getstate__(self):
+            # spilled values are pickled inline, spill files belong to this object only
+            data = dict(self._data)
+            for k, (path, is_str) in self._spilled.items():
+                data[k] = self._read(path, is_str)
+            return {
+                "data": data,
+                "memory_budget": self._memory_budget,
+                "spill_dir": self._spill_dir,
+                "changed": self._changed,
+                "deleted": self._deleted,
+            }
+
+        def __setstate__(self, state):
+            self.__init__(memory_budget=state["memory_budget"], spill_dir=state["spill_dir"])
+            for k, v in state["data"].items():
+                self._data[k] = v
+                self._account(k, v)
+            self._changed = state["changed"]
+            self._deleted = state["deleted"]
+
+        @property
+        def size(self):
+            return self._size
+
+        @property
+        def spilled(self):
+            return list(self._spilled.keys())
+
+        def __getitem__(self, key):
+            if key in self._spilled:
+                return self._load(key)
+            return self._data[key]
+
+        def __setitem__(self, key, value):
+            self._discard(key)
+            self._data[key] = value
+            self._account(key, value)
+            self._changed.add(key)
+            self._deleted.discard(key)
+
+        def __delitem__(self, key):
+            if key not in self:
+                raise KeyError(key)
+            self._discard(key)
+            self._deleted.add(key)
+            self._changed.discard(key)
+
+        def __contains__(self, key):
+            return key in self._data or key in self._spilled
+
+        def __iter__(self):
+            for k in list(self._data.keys()) + list(self._spilled.keys()):
+                yield k
+
+        def __len__(self):
+            return len(self._data) + len(self._spilled)
+
+        def __repr__(self):
+            return "{}({})".format(self.__class__.__name__, repr(self._data))
+
+        def pop_changes(self):
+            """
+            Get names of variables changed since last call, for incremental saving.
+            :return: (set of names set, set of names deleted)
+            """
+
+            changes = (self._changed, self._deleted)
+            self._changed = set()
+            self._deleted = set()
+            return changes
+
+        def dump(self, key):
+            """
+            Pickle the value of a variable, spilled values are read straight from the file without loading back.
+            :param key: name of the variable
+            :return: pickled bytes
+            """
+
+            spilled = self._spilled.get(key)
+            value = self._read(*spilled) if spilled is not None else self._data[key]
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        def clear(self):
+            for k in list(self):
+                del self[k]
+
+        def close(self, keep=None):
+            """
+            Remove all spill files, spilled variables are dropped unless kept, which are loaded back into memory.
+            :param keep: names of the variables which should be kept
+            """
+
+            keep = keep or ()
+            for k in list(self._spilled.keys()):
+                if k in keep:
+                    self._load(k, spill=False)
+                else:
+                    del self[k]
+
+        @staticmethod
+        def _remove_files(spilled):
+            for path, is_str in spilled.values():
+                if os.path.isfile(path):
+                    os.remove(path)
+            spilled.clear()
+
+        @staticmethod
+        def _read(path, is_str):
+            with open(path, "rb") as fp:
+                value = fp.read()
+            return value.decode(TinyEngine.DEFAULT_ENCODING) if is_str else value
+
+        def _account(self, key, value, spill=True):
+            if isinstance(value, (str, bytes)) and len(value) >= self.SPILL_MIN_SIZE:
+                self._sizes[key] = len(value)
+                self._size += len(value)
+                if spill:
+                    self._spill(keep=key)
+
+        def _discard(self, key):
+            self._data.pop(key, None)
+            self._size -= self._sizes.pop(key, 0)
+            spilled = self._spilled.pop(key, None)
+            if spilled is not None:
+                os.remove(spilled[0])
+
+        def _spill(self, keep=None):
+            """
+            Spill the largest values other than keep to temporary files until the size is within the memory budget.
+            :param keep: name of the variable which should stay in memory
+            """
+
+            budget = self._memory_budget
+            if budget is None:
+                return
+            candidates = sorted((k for k in self._sizes if k != keep), key=lambda k: self._sizes[k])
+            while self._size > budget and candidates:
+                k = candidates.pop()
+                value = self._data.pop(k)
+                is_str = isinstance(value, str)
+                fd, path = lazy_import("tempfile").mkstemp(prefix="tiny_vars_", dir=self._spill_dir)
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(value.encode(TinyEngine.DEFAULT_ENCODING) if is_str else value)
+                self._spilled[k] = (path, is_str)
+                self._size -= self._sizes.pop(k)
+
+        def _load(self, key, spill=True):
+            path, is_str = self._spilled.pop(key)
+            value = self._read(path, is_str)
+            os.remove(path)
+            self._data[key] = value
+            self._account(key, value, spill=spill)
+            return value
+
     class Args:
         """
         For saving current script running environment
         """
 
-        def __init__(self):
+        def __init__(self, memory_budget=None, spill_dir=None):
             self._args = dict()
-            self._vars = dict()
+            self._vars = TinyEngine.Vars(memory_budget=memory_budget, spill_dir=spill_dir)
 
         @property
         def vars(self):
@@ -110,12 +318,13 @@ class TinyEngine:
                 if value is not None:
                     d_keys.append(i)
 
-            o_str = deepcopy(v_str)
+            o_str = v_str
             for i in d_keys:
                 o_str = o_str.replace(v_prefix + i + v_suffix, str(var_dict.get(i)))
             return o_str
 
     def __init__(self, fp=None, script=None, encoding=None, data_encoding=None, logger=None, args=None, callback=None,
+                 memory_budget=None, release_vars=False, keep_vars=None, checkpoint_file=None, checkpoint_every=None,
                  **kwargs):
         self._fp = None
         self._script = None
@@ -123,9 +332,28 @@ class TinyEngine:
         self._data_encoding = data_encoding if data_encoding is not None else self.DEFAULT_ENCODING
 
         self._logger = logger or get_logger()
-        self._args = args or self.Args()
+        self._args = args or self.Args(memory_budget=memory_budget)
         self._callback = callback
 
+        # liveness based releasing of variables no longer used by the rest of the script,
+        # keep_vars are also the spilled variables loaded back when the run finishes, others are dropped
+        # (without releasing, spilled variables stay readable until args.vars.close() or being dropped)
+        self._release_vars = release_vars
+        self._keep_vars = set(keep_vars or [])
+        self._release_plan = {}
+
+        # program position for suspending, and the position to resume from
+        self._frames = []
+        self._resume_path = []
+
+        # checkpoints saved at checkpoint nodes, or every N nodes, full vars first and then deltas
+        self._checkpoint_file = checkpoint_file
+        self._checkpoint_every = checkpoint_every
+        self._checkpoint_nodes = 0
+        self._checkpoint_full_size = None  # bytes of the last full record, None if not saved in this run yet
+        self._checkpoint_delta_size = 0  # bytes of deltas appended after it
+        self._checkpoint_script = None  # hash of the running script object
+
         # map for flow controlling
         self._exceptions_map = {
             self.CMD_RERUN: self.RerunException,
@@ -168,6 +396,12 @@ class TinyEngine:
             self.CMD_WRITE: self.run_write,
             # append: append to the specific file with specific encoding
             self.CMD_APPEND: self.run_write,
+            # del: release variables from args.vars
+            self.CMD_DEL: self.run_del,
+            # wait: suspend the script until the host resumes it with the external input for a variable
+            self.CMD_WAIT: self.run_wait,
+            # checkpoint: save the position after this node and args.vars, if checkpoint file is set
+            self.CMD_CHECKPOINT: self.run_checkpoint,
         })
         self.AFUNC_MAP = {
             self.AFUNC_RE: self.afunc_re,
@@ -180,19 +414,32 @@ class TinyEngine:
         self._script_obj = None
         if fp:
             self.load_from_file(fp, encoding)
-        else:
+        elif script is not None:
             self.load_from_str(script)
 
         self._logger.debug("[{}][{}] TinyEngine loaded. ({})".format(self.__class__.__name__,
                                                                      sys._getframe().f_code.co_name,
                                                                      __version__))
 
+    @property
+    def script_obj(self):
+        return self._script_obj
+
     def afunc_re(self, a, b):
         return re.search(b, a)
 
     def afunc_in(self, a, b):
         return a in b
 
+    @classmethod
+    def preload(cls):
+        """
+        Import all lazily imported modules right now, e.g. for warming up long-running workers.
+        """
+
+        for name in cls.LAZY_MODULES:
+            lazy_import(name)
+
     def register_runner(self, cmd, func):
         if isinstance(cmd, str) and (isinstance(func, types.FunctionType) or isinstance(func, types.MethodType)):
             self._cmd_runners[cmd] = func
@@ -212,36 +459,329 @@ class TinyEngine:
     def load_from_str(self, script):
         self._script = script
         try:
-            self._script_obj = json5.loads(script)
-        except Exception as e1:
-            err1 = str(e1)
+            # plain JSON is parsed fast without importing json5
+            self._script_obj = json.loads(script)
+        except Exception as e2:
+            err2 = str(e2)
             try:
-                self._script_obj = json.loads(script)
-            except Exception as e2:
-                err2 = str(e2)
+                self._script_obj = lazy_import("json5").loads(script)
+            except Exception as e1:
+                err1 = str(e1)
                 raise RuntimeError(err1 + " | " + err2)
 
-    def run(self, sobj=None):
+    def run(self, sobj=None, args=None):
         """
         Quick start for running script node.
         :param sobj: script node object
+        :param args: script running environment, self.args is used if not set
+        :return: script result from self.execute_script()
+        """
+
+        if sobj is None:
+            sobj = self._script_obj
+        if args is None:
+            args = self._args
+        if self._release_vars:
+            self._release_plan = self.build_release_plan(sobj)
+        if self._checkpoint_file is not None:
+            self._checkpoint_script = self.script_hash(sobj)
+            self.restore_checkpoint(args)
+        return self.execute_script(sobj, args)
+
+    def resume(self, continuation, value=None, sobj=None):
+        """
+        Resume a suspended script from the program position of the continuation.
+        :param continuation: continuation returned by self.execute_script()
+        :param value: external input saved to the waiting variable
+        :param sobj: script node object which was suspended
         :return: script result from self.execute_script()
         """
 
         if sobj is None:
             sobj = self._script_obj
-        args = self._args
+        args = continuation.args
+        if continuation.var is not None:
+            args.vars[continuation.var] = value
+        if continuation.path is None:
+            return None
+        if self._release_vars:
+            self._release_plan = self.build_release_plan(sobj)
+        if self._checkpoint_file is not None:
+            self._checkpoint_script = self.script_hash(sobj)
+        self._resume_path = list(continuation.path)
         return self.execute_script(sobj, args)
 
+    def next_position(self):
+        """
+        Get the program position after the running node, for resuming later.
+        :return: path of indexes in sub script lists and frames of command nodes, or None if nothing is left to run
+        """
+
+        path = list(self._frames)
+        while path and not isinstance(path[-1], int):
+            path.pop()
+        if not path:
+            return None
+        path[-1] += 1
+        return path
+
+    @staticmethod
+    def is_trusted_path(path):
+        """
+        Check if a path is owned by the current user and not writable by others, before loading code or pickles.
+        :param path: file or dir path
+        :return: True if trusted
+        """
+
+        if not hasattr(os, "getuid"):
+            return True
+        st = os.stat(path)
+        return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+    @staticmethod
+    def script_hash(sobj):
+        dumped = json.dumps(sobj, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha1(dumped.encode(TinyEngine.DEFAULT_ENCODING)).hexdigest()
+
+    def save_checkpoint(self, args):
+        """
+        Save the position after the running node and args.vars, the first record is full and later ones are deltas.
+        The file is compacted into a new full record once the deltas outgrow the last full record.
+        :param args: script running environment
+        """
+
+        logger = self._logger
+        path = self.next_position()
+        if path is None:
+            return
+        vars = args.vars
+        changed, deleted = vars.pop_changes()
+
+        full = self._checkpoint_full_size is None
+        if not full:
+            data = self.dump_checkpoint(vars, path, [k for k in changed if k in vars], deleted, False)
+            full = self._checkpoint_delta_size + len(data) > self._checkpoint_full_size
+        if full:
+            data = self.dump_checkpoint(vars, path, list(vars.keys()), [], True)
+            fd = os.open(self._checkpoint_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            self._checkpoint_full_size = len(data)
+            self._checkpoint_delta_size = 0
+        else:
+            with open(self._checkpoint_file, "ab") as fp:
+                fp.write(data)
+            self._checkpoint_delta_size += len(data)
+        logger.debug("[{}][{}] checkpoint saved at {} ({} bytes{})".format(self.__class__.__name__,
+                                                                           sys._getframe().f_code.co_name,
+                                                                           repr(path), len(data),
+                                                                           ", full" if full else ""))
+
+    def dump_checkpoint(self, vars, path, names, deleted, full):
+        logger = self._logger
+        values = {}
+        for k in names:
+            try:
+                values[k] = vars.dump(k)
+            except Exception as e:
+                logger.warning("[{}][{}] variable {} is not saved! ({})".format(self.__class__.__name__,
+                                                                               sys._getframe().f_code.co_name,
+                                                                               repr(k), str(e)))
+        record = {
+            "full": full,
+            "script": self._checkpoint_script if full else None,
+            "path": path,
+            "set": values,
+            "del": list(deleted),
+        }
+        return pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+
+    def restore_checkpoint(self, args):
+        """
+        Restore args.vars and the position to resume from, by replaying records in the checkpoint file.
+        :param args: script running environment
+        :return: True if restored
+        """
+
+        logger = self._logger
+        if not os.path.isfile(self._checkpoint_file):
+            return False
+        if not self.is_trusted_path(self._checkpoint_file):
+            logger.warning("[{}][{}] checkpoint {} is not private, ignored!".format(self.__class__.__name__,
+                                                                                   sys._getframe().f_code.co_name,
+                                                                                   repr(self._checkpoint_file)))
+            return False
+
+        # replayed record by record, only the latest full record and its deltas are kept
+        script = None
+        saved = None
+        path = None
+        with open(self._checkpoint_file, "rb") as fp:
+            while True:
+                try:
+                    record = pickle.load(fp)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # the last record may be truncated by a crash while saving
+                    logger.warning("[{}][{}] broken checkpoint record ignored! ({})".format(
+                        self.__class__.__name__, sys._getframe().f_code.co_name, str(e)))
+                    break
+                if record["full"]:
+                    script = record["script"]
+                    saved = {}
+                elif saved is None:
+                    continue
+                for k in record["del"]:
+                    saved.pop(k, None)
+                saved.update(record["set"])
+                path = record["path"]
+        if saved is None:
+            return False
+        if script != self._checkpoint_script:
+            logger.warning("[{}][{}] checkpoint {} of another script ignored!".format(self.__class__.__name__,
+                                                                                     sys._getframe().f_code.co_name,
+                                                                                     repr(self._checkpoint_file)))
+            return False
+
+        vars = args.vars
+        for k, v in saved.items():
+            vars[k] = pickle.loads(v)
+        vars.pop_changes()
+        # compacted into a new full record by the next save
+        self._checkpoint_full_size = None
+        self._resume_path = path
+        logger.info("[{}][{}] resuming from checkpoint {} at {}".format(self.__class__.__name__,
+                                                                       sys._getframe().f_code.co_name,
+                                                                       repr(self._checkpoint_file),
+                                                                       repr(self._resume_path)))
+        return True
+
+    def clear_checkpoint(self):
+        if self._checkpoint_file is not None and os.path.isfile(self._checkpoint_file):
+            os.remove(self._checkpoint_file)
+        self._checkpoint_full_size = None
+
+    def script_refs(self, sobj, refs=None):
+        """
+        Collect all strings in a script node which may refer to variables, including $%name%$ placeholders.
+        :param sobj: script node object
+        :param refs: set to collect into
+        :return: set of referred names
+        """
+
+        if refs is None:
+            refs = set()
+        if isinstance(sobj, str):
+            refs.add(sobj)
+            refs.update(self.VAR_PLACEHOLDER_RE.findall(sobj))
+        elif isinstance(sobj, list):
+            for i in sobj:
+                self.script_refs(i, refs)
+        elif isinstance(sobj, dict):
+            for k, v in sobj.items():
+                self.script_refs(k, refs)
+                self.script_refs(v, refs)
+        return refs
+
+    def script_reruns(self, sobj):
+        """
+        Check if a script node may rerun the sub script list containing it, nested sub script lists rerun themselves.
+        :param sobj: script node object
+        :return: True if rerun may be requested
+        """
+
+        if not isinstance(sobj, list) or len(sobj) < 1 or not isinstance(sobj[0], str):
+            return False
+        return sobj[0] == self.CMD_RERUN or any(self.script_reruns(csub) for csub in sobj[2:])
+
+    def build_release_plan(self, sobj, live_out=frozenset(), plan=None, root_refs=None):
+        """
+        Liveness analysis over the script, finding variables which are dead after each node of the sub script lists.
+        Analysis is conservative: a string anywhere in a node counts as a use, nodes with call or callback use
+        everything in the script, and sub script lists with rerun keep their variables alive for the whole loop.
+        :param sobj: script node object
+        :param live_out: names still used after the script node finished
+        :param plan: plan to collect into
+        :param root_refs: names referred in the whole script
+        :return: plan, {id(sub script list): (sub script list, [set of dead names after each node])}
+        """
+
+        if plan is None:
+            plan = {}
+        if root_refs is None:
+            root_refs = self.script_refs(sobj)
+        if not isinstance(sobj, list) or len(sobj) < 1:
+            return plan
+
+        if isinstance(sobj[0], str):
+            # sub script lists of a command run before the command finished
+            for csub in sobj[2:]:
+                self.build_release_plan(csub, live_out, plan, root_refs)
+            return plan
+
+        live = set(live_out) | self._keep_vars
+        refs_list = []
+        for sub_sobj in sobj:
+            refs = self.script_refs(sub_sobj)
+            if self.CMD_CALL in refs or self.CMD_CALLBACK in refs:
+                refs |= root_refs
+            refs_list.append(refs)
+        if any(self.script_reruns(sub_sobj) for sub_sobj in sobj):
+            for refs in refs_list:
+                live |= refs
+
+        dead_list = [None] * len(sobj)
+        for i in reversed(range(len(sobj))):
+            dead_list[i] = refs_list[i] - live
+            self.build_release_plan(sobj[i], frozenset(live), plan, root_refs)
+            live |= refs_list[i]
+        plan[id(sobj)] = (sobj, dead_list)
+        return plan
+
+    def close_vars(self, args):
+        if self._release_vars:
+            args.vars.close(keep=self._keep_vars)
+
+    def release_dead_vars(self, args, dead):
+        vars = args.vars
+        for k in dead:
+            if k in vars:
+                del vars[k]
+                self._logger.debug("[{}][{}] variable {} released".format(self.__class__.__name__,
+                                                                          sys._getframe().f_code.co_name,
+                                                                          repr(k)))
+
     def execute_script(self, sobj, args, depth=0):
         """
         Recursively run one node in the script flow.
         :param sobj: script node object
         :param args: script running environment
         :param depth: recursive depth record
-        :return: script result of one command, or None
+        :return: script result of one command, or None, or a continuation if suspended by a wait node
         """
 
+        if depth == 0:
+            self._frames = []
+            try:
+                result = self.execute_node(sobj, args, depth)
+                self.clear_checkpoint()
+                self.close_vars(args)
+                return result
+            except self.FinishException as f_exp:
+                self.clear_checkpoint()
+                self.close_vars(args)
+                raise f_exp
+            except self.SuspendException as s_exp:
+                self._logger.info("[{}][{}] suspended, waiting for {}".format(self.__class__.__name__,
+                                                                             sys._getframe().f_code.co_name,
+                                                                             repr(s_exp.var)))
+                return self.Continuation(s_exp.path, args, s_exp.var)
+            finally:
+                self._resume_path = []
+        return self.execute_node(sobj, args, depth)
+
+    def execute_node(self, sobj, args, depth=0):
         logger = self._logger
 
         runners = self._cmd_runners
@@ -249,6 +789,8 @@ class TinyEngine:
             if len(sobj) >= 1:
                 cmd = sobj[0]
                 if isinstance(cmd, str):
+                    if self._resume_path:
+                        return self.resume_cmd(sobj, args, depth)
                     func = runners.get(cmd)
                     if func is not None:
                         logger.debug("[{}][{}] Running cmd: {}".format(self.__class__.__name__,
@@ -259,20 +801,77 @@ class TinyEngine:
                     logger.debug("[{}][{}] Running sub script (depth={})...".format(self.__class__.__name__,
                                                                                     sys._getframe().f_code.co_name,
                                                                                     depth))
+                    release = self._release_plan.get(id(sobj))
+                    dead_list = release[1] if release is not None and release[0] is sobj else None
+                    start = self._resume_path.pop(0) if self._resume_path else 0
+                    if not isinstance(start, int) or not 0 <= start <= len(sobj):
+                        logger.warning("[{}][{}] invalid resume step {} for sub script, running it from the beginning!"
+                                       .format(self.__class__.__name__, sys._getframe().f_code.co_name, repr(start)))
+                        self._resume_path = []
+                        start = 0
                     rerun_requested = True
                     while rerun_requested:
                         rerun_requested = False
                         try:
-                            for sub_sobj in sobj:
-                                self.execute_script(sub_sobj, args, depth + 1)
+                            for i in range(start, len(sobj)):
+                                self._frames.append(i)
+                                try:
+                                    self.execute_script(sobj[i], args, depth + 1)
+                                    if dead_list is not None:
+                                        self.release_dead_vars(args, dead_list[i])
+                                    self.count_checkpoint(args)
+                                finally:
+                                    self._frames.pop()
                         except self.RerunException:
                             rerun_requested = True
+                            start = 0
                         except self.BreakException:
                             pass
                         except self.FinishException as f_exp:
                             raise f_exp
         return None
 
+    def count_checkpoint(self, args):
+        every = self._checkpoint_every
+        if self._checkpoint_file is not None and every:
+            self._checkpoint_nodes += 1
+            if self._checkpoint_nodes % every == 0:
+                self.save_checkpoint(args)
+
+    def resume_cmd(self, sobj, args, depth=0):
+        """
+        Resume into the sub script of a command node, the remaining of the command is run as usual.
+        :param sobj: script node object of the command
+        :param args: script running environment
+        :param depth: recursive depth record
+        :return: None
+        """
+
+        logger = self._logger
+        step = self._resume_path.pop(0)
+        kind, k = step if isinstance(step, (list, tuple)) and len(step) == 2 else (None, None)
+        cargs = sobj[1] if len(sobj) > 1 else None
+        cl = [cargs] if isinstance(cargs, str) else cargs
+        valid = isinstance(k, int) and k >= 0 and (kind == self.FRAME_SUB and 2 <= k < len(sobj) or
+                                                   kind == self.FRAME_CALL and isinstance(cl, list) and k < len(cl))
+        if not valid:
+            logger.warning("[{}][{}] invalid resume step {} for cmd {}, running it from the beginning!".format(
+                self.__class__.__name__, sys._getframe().f_code.co_name, repr(step), repr(sobj[0])))
+            self._resume_path = []
+            return self.execute_node(sobj, args, depth)
+
+        if kind == self.FRAME_CALL:
+            for i in range(k, len(cl)):
+                self.execute_call(cl, i, args, depth)
+        else:
+            self._frames.append((self.FRAME_SUB, k))
+            try:
+                self.execute_script(sobj[k], args, depth + 1)
+            finally:
+                self._frames.pop()
+
+        return None
+
     def run_vars_d(self, sobj, args, depth=0):
         logger = self._logger
         cmd = sobj[0]
@@ -345,20 +944,29 @@ class TinyEngine:
 
         cl = [cargs] if isinstance(cargs, str) else cargs if isinstance(cargs, list) else None
         if cl is not None:
-            for k in cl:
-                v = args.vars.get(k)
-                if isinstance(v, list):
-                    logger.info("[{}][{}] calling sub script list {}...".format(self.__class__.__name__,
-                                                                                sys._getframe().f_code.co_name,
-                                                                                repr(k)))
-                    sub_sobj = v
-                    self.execute_script(sub_sobj, args, depth + 1)  # TODO Need returned value
-                else:
-                    logger.info("[{}][{}] {} is not a sub script list!".format(self.__class__.__name__,
-                                                                               sys._getframe().f_code.co_name, repr(k)))
+            for i in range(len(cl)):
+                self.execute_call(cl, i, args, depth)
 
         return None
 
+    def execute_call(self, cl, i, args, depth=0):
+        logger = self._logger
+        k = cl[i]
+        v = args.vars.get(k)
+        if isinstance(v, list):
+            logger.info("[{}][{}] calling sub script list {}...".format(self.__class__.__name__,
+                                                                        sys._getframe().f_code.co_name,
+                                                                        repr(k)))
+            sub_sobj = v
+            self._frames.append((self.FRAME_CALL, i))
+            try:
+                self.execute_script(sub_sobj, args, depth + 1)  # TODO Need returned value
+            finally:
+                self._frames.pop()
+        else:
+            logger.info("[{}][{}] {} is not a sub script list!".format(self.__class__.__name__,
+                                                                       sys._getframe().f_code.co_name, repr(k)))
+
     def run_except(self, sobj, args, depth=0):
         logger = self._logger
         cmd = sobj[0]
@@ -410,7 +1018,11 @@ class TinyEngine:
         if assert_result and csub:
             logger.debug("[{}][{}] assert result is True!".format(self.__class__.__name__,
                                                                   sys._getframe().f_code.co_name))
-            self.execute_script(csub, args, depth + 1)
+            self._frames.append((self.FRAME_SUB, 2))
+            try:
+                self.execute_script(csub, args, depth + 1)
+            finally:
+                self._frames.pop()
 
         return None
 
@@ -462,7 +1074,11 @@ class TinyEngine:
         if assert_result and csub:
             logger.debug("[{}][{}] assert result is True!".format(self.__class__.__name__,
                                                                   sys._getframe().f_code.co_name))
-            self.execute_script(csub, args, depth + 1)
+            self._frames.append((self.FRAME_SUB, 2))
+            try:
+                self.execute_script(csub, args, depth + 1)
+            finally:
+                self._frames.pop()
 
         return None
 
@@ -477,7 +1093,7 @@ class TinyEngine:
         dest_var = cargs[2] if len(cargs) > 2 else var
 
         value = args.vars.get(var)
-        parser = jp.parse(jpath)
+        parser = lazy_import("jsonpath_rw").parse(jpath)
         result = [match.value for match in parser.find(value)]
         args.vars[dest_var] = result
 
@@ -494,7 +1110,7 @@ class TinyEngine:
         dest_var = cargs[2] if len(cargs) > 2 else var
 
         value = args.vars.get(var)
-        et = et_fromstring(value)
+        et = lazy_import("lxml.etree").fromstring(value)
         result = et.xpath(xpath)
         args.vars[dest_var] = result
 
@@ -555,6 +1171,54 @@ class TinyEngine:
 
         return None
 
+    def run_del(self, sobj, args, depth=0):
+        logger = self._logger
+        cmd = sobj[0]
+        cargs = sobj[1] if len(sobj) > 1 else None
+        csub = sobj[2] if len(sobj) > 2 else None
+
+        cl = [cargs] if isinstance(cargs, str) else cargs if isinstance(cargs, list) else None
+        if cl is not None:
+            vars = args.vars
+            for k in cl:
+                if k in vars:
+                    del vars[k]
+                    logger.info("[{}][{}] variable {} deleted".format(self.__class__.__name__,
+                                                                      sys._getframe().f_code.co_name,
+                                                                      repr(k)))
+
+        return None
+
+    def run_wait(self, sobj, args, depth=0):
+        logger = self._logger
+        cmd = sobj[0]
+        cargs = sobj[1] if len(sobj) > 1 else None
+        csub = sobj[2] if len(sobj) > 2 else None
+
+        # ['wait', 'var']
+        var = cargs
+        if not isinstance(var, str):
+            raise RuntimeError("'var' is not valid!")
+        path = self.next_position()
+        logger.debug("[{}][{}] suspending at {}".format(self.__class__.__name__,
+                                                        sys._getframe().f_code.co_name,
+                                                        repr(path)))
+        raise self.SuspendException(path, var)
+
+    def run_checkpoint(self, sobj, args, depth=0):
+        logger = self._logger
+        cmd = sobj[0]
+        cargs = sobj[1] if len(sobj) > 1 else None
+        csub = sobj[2] if len(sobj) > 2 else None
+
+        if self._checkpoint_file is not None:
+            self.save_checkpoint(args)
+        else:
+            logger.debug("[{}][{}] checkpoint file is not set!".format(self.__class__.__name__,
+                                                                       sys._getframe().f_code.co_name))
+
+        return None
+
 
 if __name__ == "__main__":
     # TODO For debugging
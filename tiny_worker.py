@@ -0,0 +1,319 @@
+# coding=utf-8
+
+import sys
+import os
+import time
+import json
+import logging
+import argparse
+import socketserver
+import threading
+from multiprocessing import Pool, cpu_count
+
+from MiniUtils import get_logger
+from tiny_engine import TinyEngine, __version__
+
+ENGINE_TINY = "tiny"
+ENGINE_REQUESTS = "requests"
+ENGINE_NAMES = [ENGINE_TINY, ENGINE_REQUESTS]
+
+JOB_ID = "id"
+JOB_SCRIPT = "script"
+JOB_VARS = "vars"
+JOB_ENCODING = "encoding"
+JOB_PATH = "path"
+JOB_WAIT = "wait"
+JOB_VALUE = "value"
+
+DEFAULT_LOG_LEVEL = "WARNING"  # of the job engines, logging every node of every job slows the workers down
+
+# per process states of the pool workers
+_engine_cls = None
+_logger = None
+_script_cache = {}
+
+
+def get_engine_cls(engine_name):
+    if engine_name == ENGINE_REQUESTS:
+        from tools.TinyRequestsEngine import TinyRequestsEngine
+        return TinyRequestsEngine
+    return TinyEngine
+
+
+def get_worker_logger(name, log_level=DEFAULT_LOG_LEVEL, log_dir=None):
+    """
+    Get a logger to stderr, and to "log_<name>.txt" in log_dir if set.
+    :param name: logger name
+    :param log_level: level name or number
+    :param log_dir: directory of the log file, no log file if not set
+    :return: logger
+    """
+
+    if log_dir:
+        return get_logger(name, stream_log_level=log_level, file_log_level=log_level, log_dir=log_dir)
+
+    logger = logging.getLogger(name)
+    if len(logger.handlers) <= 0:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("[%(asctime)s][%(levelname)s]%(message)s", "%Y-%m-%d %H:%M:%S"))
+        logger.addHandler(handler)
+        logger.setLevel(log_level)
+        logger.propagate = False
+    return logger
+
+
+def init_worker(engine_name, log_level=DEFAULT_LOG_LEVEL, log_dir=None):
+    """
+    Initializer of the pool workers, warming up the engine once per process.
+    :param engine_name: one of ENGINE_NAMES
+    :param log_level: log level of the job engines
+    :param log_dir: directory of the per process log files, no log file if not set
+    """
+
+    global _engine_cls, _logger
+    _logger = get_worker_logger("worker_{}".format(os.getpid()), log_level, log_dir)
+    _engine_cls = get_engine_cls(engine_name)
+    _engine_cls.preload()  # already imported by the parent before forking, unless workers are spawned
+    _engine_cls(script="[]", logger=_logger).run()
+
+
+def load_script(fp, encoding=None):
+    """
+    Load script object from file, cached by path and modification time.
+    :param fp: script file path
+    :param encoding: script file encoding
+    :return: script object
+    """
+
+    fp = os.path.abspath(fp)
+    mtime = os.stat(fp).st_mtime
+    cached = _script_cache.get(fp)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    sobj = _engine_cls(fp=fp, encoding=encoding, logger=_logger).script_obj
+    _script_cache[fp] = (mtime, sobj)
+    return sobj
+
+
+def run_job(task):
+    """
+    Run one job record in a pool worker, a suspended job is reported with "wait" and "path", and resumed by a job
+    record with them plus "vars" and the input "value".
+    :param task: (JSON string of the job record, like {"id": ..., "script": "a.json5", "vars": {...}}, submit time)
+    :return: (submit time, result record with status and variables after running, or error message)
+    """
+
+    line, submitted = task
+
+    started = time.time()
+    job_id = None
+    try:
+        job = json.loads(line)
+        job_id = job.get(JOB_ID)
+        sobj = load_script(job[JOB_SCRIPT], job.get(JOB_ENCODING))
+
+        engine = _engine_cls(logger=_logger)
+        args = engine.Args()
+        args.vars.update(job.get(JOB_VARS) or {})
+        if JOB_PATH in job:
+            continuation = engine.resume(engine.Continuation(job[JOB_PATH], args, job.get(JOB_WAIT)),
+                                         job.get(JOB_VALUE), sobj)
+        else:
+            continuation = engine.run(sobj, args)
+        result = {"ok": True, "vars": dict(args.vars)}
+        if isinstance(continuation, TinyEngine.Continuation):
+            result[JOB_WAIT] = continuation.var
+            result[JOB_PATH] = continuation.path
+    except TinyEngine.FinishException:
+        result = {"ok": True, "vars": dict(args.vars)}
+    except Exception as e:
+        result = {"ok": False, "error": "{}: {}".format(e.__class__.__name__, str(e))}
+
+    result[JOB_ID] = job_id
+    result["service"] = time.time() - started
+    return submitted, result
+
+
+class WorkerStats:
+    """
+    Throughput and latency statistics of the finished jobs
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._latencies = []  # from submitting to the pool until the result is back, including queueing
+        self._services = []  # running in the pool worker only
+        self._failed = 0
+
+    def add(self, result):
+        with self._lock:
+            self._latencies.append(result.get("latency", 0.0))
+            self._services.append(result.get("service", 0.0))
+            if not result.get("ok"):
+                self._failed += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            services = list(self._services)
+            failed = self._failed
+        wall = time.time() - self._started
+        count = len(latencies)
+
+        def percentile(p):
+            return latencies[min(count - 1, int(count * p))] if count > 0 else 0.0
+
+        return {
+            "jobs": count,
+            "failed": failed,
+            "wall": wall,
+            "throughput": count / wall if wall > 0 else 0.0,
+            "latency_mean": sum(latencies) / count if count > 0 else 0.0,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": latencies[-1] if count > 0 else 0.0,
+            "service_mean": sum(services) / count if count > 0 else 0.0,
+        }
+
+
+class TinyWorker:
+    """
+    Long-running service dispatching JSONL job records to a pool of pre-forked engine workers
+    """
+
+    def __init__(self, processes=None, engine_name=ENGINE_TINY, logger=None, log_level=DEFAULT_LOG_LEVEL,
+                 log_dir=None):
+        self._logger = logger or get_worker_logger("tiny_worker", logging.INFO, log_dir)
+        self._processes = processes or cpu_count()
+        self._engine_name = engine_name
+        self._log_level = log_level
+        self._log_dir = log_dir
+        self._pool = None
+        self._stats = WorkerStats()
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def start(self):
+        logger = self._logger
+        if self._pool is None:
+            # import everything before forking, so the workers share it copy-on-write
+            get_engine_cls(self._engine_name).preload()
+            self._pool = Pool(self._processes, initializer=init_worker,
+                              initargs=(self._engine_name, self._log_level, self._log_dir))
+            logger.info("[{}][{}] {} workers started. ({})".format(self.__class__.__name__,
+                                                                  sys._getframe().f_code.co_name,
+                                                                  self._processes, __version__))
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.report()
+
+    def report(self):
+        logger = self._logger
+        summary = self._stats.summary()
+        logger.info("[{}][{}] {} jobs ({} failed) in {:.3f}s, {:.2f} jobs/s, "
+                    "latency mean={:.4f}s p50={:.4f}s p95={:.4f}s max={:.4f}s, service mean={:.4f}s".format(
+                        self.__class__.__name__, sys._getframe().f_code.co_name,
+                        summary["jobs"], summary["failed"], summary["wall"], summary["throughput"],
+                        summary["latency_mean"], summary["latency_p50"], summary["latency_p95"],
+                        summary["latency_max"], summary["service_mean"]))
+        return summary
+
+    def process(self, lines, out):
+        """
+        Dispatch job records to the pool, and stream results out as JSONL in finishing order.
+        :param lines: iterable of job record strings
+        :param out: writable text stream for result records
+        """
+
+        self.start()
+        tasks = ((line, time.time()) for line in lines if line.strip())
+        for submitted, result in self._pool.imap_unordered(run_job, tasks):
+            result["latency"] = time.time() - submitted
+            self._stats.add(result)
+            out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+
+    def serve_unix(self, path):
+        """
+        Serve job records from clients of a local Unix socket, one JSONL stream per connection.
+        :param path: path of the Unix socket
+        """
+
+        worker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                out = self.wfile
+                lines = (line.decode(TinyEngine.DEFAULT_ENCODING) for line in self.rfile)
+                writer = _SocketWriter(out)
+                worker.process(lines, writer)
+                worker.report()
+
+        if os.path.exists(path):
+            os.remove(path)
+        self.start()
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+            self._logger.info("[{}][{}] listening on {}".format(self.__class__.__name__,
+                                                               sys._getframe().f_code.co_name,
+                                                               repr(path)))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        os.remove(path)
+
+
+class _SocketWriter:
+    def __init__(self, wfile):
+        self._wfile = wfile
+
+    def write(self, s):
+        self._wfile.write(s.encode(TinyEngine.DEFAULT_ENCODING))
+
+    def flush(self):
+        self._wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run TinyEngine script jobs from JSONL records.")
+    parser.add_argument("jobs", nargs="?", help="JSONL file of job records, stdin if not set")
+    parser.add_argument("-s", "--socket", help="serve job records on a local Unix socket instead")
+    parser.add_argument("-o", "--output", help="JSONL file for result records, stdout if not set")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-e", "--engine", choices=ENGINE_NAMES, default=ENGINE_TINY, help="engine class of workers")
+    parser.add_argument("--log-level", default=DEFAULT_LOG_LEVEL,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], help="log level of the job engines")
+    parser.add_argument("--log-dir", help="directory of the log files, one per worker process, none if not set")
+    opts = parser.parse_args(argv)
+
+    worker = TinyWorker(processes=opts.processes, engine_name=opts.engine, log_level=opts.log_level,
+                        log_dir=opts.log_dir)
+    try:
+        if opts.socket:
+            worker.serve_unix(opts.socket)
+            return 0
+
+        out = open(opts.output, "w", encoding=TinyEngine.DEFAULT_ENCODING) if opts.output else sys.stdout
+        inp = open(opts.jobs, "r", encoding=TinyEngine.DEFAULT_ENCODING) if opts.jobs else sys.stdin
+        try:
+            worker.process(inp, out)
+        finally:
+            if inp is not sys.stdin:
+                inp.close()
+            if out is not sys.stdout:
+                out.close()
+    finally:
+        worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
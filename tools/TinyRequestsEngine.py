@@ -1,9 +1,11 @@
 # coding=utf-8
 
-from tiny_engine import TinyEngine
+import sys
+import os
+import hashlib
 
-import requests
-import js2py
+from tiny_engine import TinyEngine
+from MiniUtils import lazy_import
 
 
 class TinyRequestsEngine(TinyEngine):  # TODO
@@ -15,6 +17,9 @@ class TinyRequestsEngine(TinyEngine):  # TODO
     DEFAULT_REQUEST_TIMEOUT = 10
     DEFAULT_ENCODING = "utf-8"
     DEFAULT_GET_BYTES = False
+    DEFAULT_JS_CACHE_DIR = None  # "tiny_engine_js" in the user's cache dir if not set
+
+    LAZY_MODULES = TinyEngine.LAZY_MODULES + ["requests", "js2py"]
 
     CMD_GET_ = "get_"
     CMD_POST_ = "post_"
@@ -31,26 +36,125 @@ class TinyRequestsEngine(TinyEngine):  # TODO
     ARG_TIMEOUT = "timeout"
     ARG_ENCODING = "encoding"
     ARG_GET_BYTES = "get_bytes"
+    ARG_JS = "js"
+    ARG_FUNC = "func"
+
+    # translated JS compiled code shared in process, cache key -> code object
+    _js_codes = {}
+    _js2py_version = None
 
     def __init__(self, fp=None, script=None, encoding=None, data_encoding=None, logger=None, args=None, callback=None,
-                 **kwargs):
+                 js_cache_dir=None, **kwargs):
         super(TinyRequestsEngine, self).__init__(fp=fp, script=script, encoding=encoding, data_encoding=data_encoding,
                                                  logger=logger, args=args, callback=callback,
                                                  **kwargs)
 
-        self._session = requests.session()
-        self._cookies = requests.cookies.RequestsCookieJar()
+        self._session = None
+        self._cookies = None
+        self._js_cache_dir = js_cache_dir or self.DEFAULT_JS_CACHE_DIR
+        self._js_scopes = {}  # cache key -> js2py scope, run per engine so JS globals do not leak between engines
 
         # Register runners for Requests and js2py
         self.register_runners({
             self.CMD_GET_: self.run_get_d,
             self.CMD_POST_: self.run_post_d,
-            # TODO js2py
+            # eval_js: call a function of JS source in args.vars, translated by js2py and cached
+            self.CMD_EVAL_JS: self.run_eval_js_d,
         })
 
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = lazy_import("requests").session()
+        return self._session
+
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            self._cookies = lazy_import("requests.cookies").RequestsCookieJar()
+        return self._cookies
+
+    @staticmethod
+    def default_js_cache_dir():
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "tiny_engine_js")
+
+    @classmethod
+    def js_cache_key(cls, js):
+        """
+        Get the cache key of JS source, the generated Python depends on js2py internals so its version is included.
+        :param js: JS source
+        :return: hex digest
+        """
+
+        if cls._js2py_version is None:
+            try:
+                cls._js2py_version = lazy_import("importlib.metadata").version("Js2Py")
+            except Exception:
+                cls._js2py_version = "unknown"
+        return hashlib.sha1((cls._js2py_version + "\n" + js).encode(cls.DEFAULT_ENCODING)).hexdigest()
+
+    def load_js(self, js):
+        """
+        Get the js2py scope of JS source, run once per engine from translated code cached in process and on disk.
+        :param js: JS source
+        :return: js2py scope with everything defined in the JS source
+        """
+
+        key = self.js_cache_key(js)
+        scope = self._js_scopes.get(key)
+        if scope is None:
+            code = self._js_codes.get(key)
+            if code is None:
+                code = self.compile_js(js, key)
+                self._js_codes[key] = code
+            namespace = {}
+            exec(code, namespace)
+            scope = namespace["var"]
+            self._js_scopes[key] = scope
+        return scope
+
+    def compile_js(self, js, key):
+        """
+        Translate JS source to compiled Python code, generated Python is persisted in the private cache dir.
+        :param js: JS source
+        :param key: cache key from self.js_cache_key()
+        :return: code object
+        """
+
+        logger = self._logger
+
+        cache_dir = self._js_cache_dir or self.default_js_cache_dir()
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        cache_file = os.path.join(cache_dir, key + ".py")
+        cache_trusted = self.is_trusted_path(cache_dir)
+        if not cache_trusted:
+            logger.warning("[{}][{}] JS cache dir {} is not private, cache is not used!".format(
+                self.__class__.__name__, sys._getframe().f_code.co_name, repr(cache_dir)))
+
+        if cache_trusted and os.path.isfile(cache_file) and self.is_trusted_path(cache_file):
+            with open(cache_file, "r", encoding=self.DEFAULT_ENCODING) as fp:
+                code = fp.read()
+            logger.debug("[{}][{}] translated JS loaded from {}".format(self.__class__.__name__,
+                                                                        sys._getframe().f_code.co_name,
+                                                                        repr(cache_file)))
+        else:
+            code = lazy_import("js2py").translate_js(js)
+            if cache_trusted:
+                tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+                with open(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w",
+                          encoding=self.DEFAULT_ENCODING) as fp:
+                    fp.write(code)
+                os.replace(tmp_file, cache_file)
+                logger.debug("[{}][{}] translated JS saved to {}".format(self.__class__.__name__,
+                                                                         sys._getframe().f_code.co_name,
+                                                                         repr(cache_file)))
+
+        return compile(code, cache_file, "exec")
+
     def session_get(self, url, headers=DEFAULT_HEADERS, timeout=DEFAULT_REQUEST_TIMEOUT, encoding="utf-8",
                     get_bytes=False):
-        session = self._session
+        session = self.session
 
         # 获取页面数据
         req = session.get(url, headers=headers, timeout=timeout)
@@ -63,7 +167,7 @@ class TinyRequestsEngine(TinyEngine):  # TODO
 
     def session_post(self, url, headers=DEFAULT_HEADERS, data=None, timeout=DEFAULT_REQUEST_TIMEOUT, encoding="utf-8",
                      get_bytes=False):
-        session = self._session
+        session = self.session
 
         # 获取页面数据
         req = session.post(url, headers=headers, data=data, timeout=timeout)
@@ -107,3 +211,35 @@ class TinyRequestsEngine(TinyEngine):  # TODO
         data = cargs.get(self.ARG_DATA)  # to data string or data dict
 
         # TODO do session_post(), and auto parse result json string to object
+
+    def run_eval_js_d(self, sobj, args, depth=0):
+        logger = self._logger
+        cmd = sobj[0]
+        cargs = sobj[1] if len(sobj) > 1 else None
+        csub = sobj[2] if len(sobj) > 2 else None
+
+        vars = args.vars
+        var = cargs.get(self.ARG_VAR)  # save result data to variable
+        js = vars.get(cargs.get(self.ARG_JS, ""), "")
+        func_name = cargs.get(self.ARG_FUNC)
+        func_args = [vars.get(i) for i in cargs.get(self.ARG_ARGS) or []]
+        if not func_name:
+            raise RuntimeError("'func' is not valid!")
+
+        scope = self.load_js(js)
+        try:
+            func = scope.get(func_name)
+        except Exception:
+            func = None
+        if func is None or not hasattr(func, "is_callable") or not func.is_callable():
+            raise RuntimeError("JS function {} is not defined!".format(repr(func_name)))
+        result = func(*func_args)
+        result = result.to_python() if hasattr(result, "to_python") else result
+        if var is not None:
+            vars[var] = result
+        logger.info("[{}][{}] {} called{}".format(self.__class__.__name__,
+                                                 sys._getframe().f_code.co_name,
+                                                 repr(func_name),
+                                                 ", result is saved to variable " + repr(var) if var else ""))
+
+        return None